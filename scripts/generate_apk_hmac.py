@@ -6,114 +6,300 @@ This script generates HMAC signatures for APK files to prevent repackaging.
 It should be run during the build process to create secure signatures.
 
 Usage:
-    python3 generate_apk_hmac.py <apk_file_path> [output_file_path]
+    python3 generate_apk_hmac.py <apk_file_path> [output_file_path] [--fast]
+    python3 generate_apk_hmac.py --batch <apk> [<apk> ...] [--manifest signatures.json] [--fast]
 
 Example:
     python3 generate_apk_hmac.py app-release.apk apk_hmac_signature.txt
+
+Passing --fast (or setting APK_HMAC_FAST=1) hashes the APK with multi-threaded
+BLAKE3 when the `blake3` package is installed. BLAKE3 is only used with a .json
+output or --batch --manifest, which record hash_algorithm; plain signature files
+always use SHA-256, which is what ApkHmacProtector recomputes on the device.
+An explicit --fast with a plain output is an error, while APK_HMAC_FAST=1 is
+ignored with a warning.
 """
 
+import argparse
+import contextlib
 import hashlib
 import hmac
 import os
 import sys
 import json
+import mmap
+import platform
+import queue
+import secrets
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+try:
+    import blake3
+except ImportError:
+    blake3 = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Read size for hashing; large blocks amortize syscall and loop overhead
+CHUNK_SIZE = 1 << 20
+# Chunks the background reader may buffer ahead of the hasher
+PREFETCH_DEPTH = 4
+
+def get_openssl_version():
+    """Return the OpenSSL version backing hashlib, or None for the builtin fallback"""
+    try:
+        import _hashlib  # noqa: F401
+        import ssl
+    except ImportError:
+        return None
+    return ssl.OPENSSL_VERSION
+
+# Printed as the hash backend in each run header
+OPENSSL_VERSION = get_openssl_version()
+
+# Host identity for key generation; platform lookups are too slow to repeat per key
+DEVICE_INFO_BYTES = f"{platform.system()}_{platform.machine()}_{platform.node()}".encode()
+
 def generate_secure_key():
     """Generate a secure HMAC key"""
     # In production, this should use a secure key derivation function
     # For demonstration, we'll use a combination of system info and random data
-    import secrets
-    import platform
+    random_data = secrets.token_hex(32).encode()
     
-    # Create a device-specific key (simulated)
-    device_info = f"{platform.system()}_{platform.machine()}_{platform.node()}"
-    random_data = secrets.token_hex(32)
-    
-    # Combine and hash to create a secure key
-    combined = f"{device_info}_{random_data}_{int(time.time())}"
-    key = hashlib.sha256(combined.encode()).digest()
+    # Combine with the device-specific prefix (simulated) and hash to create a secure key
+    combined = DEVICE_INFO_BYTES + b"_" + random_data + b"_" + str(int(time.time())).encode()
+    key = hashlib.sha256(combined).digest()
     
     return key
 
+def read_chunks_prefetched(f, chunk_size=CHUNK_SIZE):
+    """Yield chunks of f read ahead on a background thread"""
+    # hashlib releases the GIL while hashing large buffers, so disk reads
+    # overlap with hash computation instead of alternating with it
+    chunks = queue.Queue(maxsize=PREFETCH_DEPTH)
+    stop = threading.Event()
+    
+    def put(item):
+        # Give up once the consumer has stopped instead of blocking forever
+        while not stop.is_set():
+            try:
+                chunks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+    
+    def reader():
+        try:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                if not put(chunk):
+                    return
+            put(None)
+        except Exception as e:
+            put(e)
+    
+    thread = threading.Thread(target=reader, daemon=True)
+    thread.start()
+    try:
+        while True:
+            chunk = chunks.get()
+            if chunk is None:
+                break
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+    finally:
+        # Runs on early exit too (consumer error or close()): release the
+        # reader and its buffered chunks before the caller closes the file
+        stop.set()
+        while not chunks.empty():
+            chunks.get_nowait()
+        thread.join()
+
+# The hot loop is OpenSSL's SHA-256 (SHA-NI / ARMv8 crypto when available);
+# Numba or Cython would not speed it up. Only a Python-level per-chunk
+# transform added before hashing would be worth JIT-compiling.
 def calculate_apk_hash(apk_path):
     """Calculate SHA-256 hash of APK file"""
-    sha256_hash = hashlib.sha256()
-    
     with open(apk_path, "rb") as f:
-        # Read file in chunks to handle large APK files
-        for chunk in iter(lambda: f.read(8192), b""):
-            sha256_hash.update(chunk)
+        # Hint sequential access so the kernel reads ahead aggressively;
+        # advisory only, and pipes/FIFOs reject it with ESPIPE
+        if hasattr(os, "posix_fadvise"):
+            try:
+                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            except OSError:
+                pass
+        
+        # Map the whole APK and hash it in a single C call
+        try:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if hasattr(mmap, "MADV_SEQUENTIAL"):
+                    mm.madvise(mmap.MADV_SEQUENTIAL)
+                sha256_hash = hashlib.sha256()
+                sha256_hash.update(mm)
+                return sha256_hash.hexdigest()
+        except (OSError, ValueError, OverflowError):
+            # mmap unavailable (empty file, FUSE, huge file on 32-bit); stream instead
+            pass
+        
+        sha256_hash = hashlib.sha256()
+        # Read file in chunks to handle large APK files; closing() stops the
+        # reader thread while the file is still open, even if update() raises
+        with contextlib.closing(read_chunks_prefetched(f)) as chunks:
+            for chunk in chunks:
+                sha256_hash.update(chunk)
     
     return sha256_hash.hexdigest()
 
-def generate_hmac_signature(apk_path, key):
+def calculate_apk_hash_blake3(apk_path, max_threads=None):
+    """Calculate multi-threaded BLAKE3 hash of APK file"""
+    hasher = blake3.blake3(max_threads=max_threads or blake3.blake3.AUTO)
+    hasher.update_mmap(apk_path)
+    return hasher.hexdigest()
+
+def generate_hmac_signature(apk_path, key, apk_hash=None):
     """Generate HMAC-SHA256 signature for APK"""
-    # Calculate APK hash first
-    apk_hash = calculate_apk_hash(apk_path)
+    # Calculate APK hash first, unless the caller already has it
+    if apk_hash is None:
+        apk_hash = calculate_apk_hash(apk_path)
     
-    # Generate HMAC signature
-    hmac_signature = hmac.new(
-        key,
-        apk_hash.encode('utf-8'),
-        hashlib.sha256
-    ).hexdigest()
+    # Sign the hex digest, matching ApkHmacProtector on the device
+    hmac_signature = hmac.digest(key, apk_hash.encode('utf-8'), 'sha256').hex()
     
     return hmac_signature, apk_hash
 
-def create_signature_data(apk_path, hmac_signature, apk_hash, key_type="software"):
+def hash_apk(apk_path, hash_algorithm="SHA-256", blake3_threads=None):
+    """Hash APK file with the selected content hash algorithm"""
+    if hash_algorithm == "BLAKE3":
+        return calculate_apk_hash_blake3(apk_path, blake3_threads)
+    return calculate_apk_hash(apk_path)
+
+def sign_apks_batch(apk_paths, key, hash_algorithm="SHA-256", max_workers=None):
+    """Hash APKs concurrently and sign each with the shared key"""
+    # hashlib releases the GIL while hashing mapped buffers, so threads run the
+    # hashes in parallel without the fork and pickling cost of a process pool.
+    # The pool already spreads APKs across cores, so each BLAKE3 hash stays
+    # single-threaded rather than starting its own cpu_count() threads
+    with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as pool:
+        apk_hashes = list(pool.map(lambda p: hash_apk(p, hash_algorithm, blake3_threads=1), apk_paths))
+    
+    # Run the HMAC key schedule once and clone the keyed state per APK;
+    # the signed message stays the hex digest, as in generate_hmac_signature
+    template = hmac.new(key, None, hashlib.sha256)
+    results = []
+    for apk_hash in apk_hashes:
+        h = template.copy()
+        h.update(apk_hash.encode('utf-8'))
+        results.append((h.hexdigest(), apk_hash))
+    
+    return results
+
+def create_signature_data(apk_path, hmac_signature, apk_hash, key_type="software", hash_algorithm="SHA-256",
+                          timestamp=None):
     """Create comprehensive signature data"""
     apk_file = Path(apk_path)
+    # Callers that already hold an absolute path skip re-resolving it here
+    if not apk_file.is_absolute():
+        apk_file = apk_file.absolute()
     
     return {
         "apk_file": apk_file.name,
-        "apk_path": str(apk_file.absolute()),
+        "apk_path": str(apk_file),
         "apk_hash": apk_hash,
         "hmac_signature": hmac_signature,
         "key_type": key_type,
-        "timestamp": int(time.time()),
+        "timestamp": timestamp if timestamp is not None else int(time.time()),
         "algorithm": "HMAC-SHA256",
-        "hash_algorithm": "SHA-256",
+        "hash_algorithm": hash_algorithm,
         "version": "1.0.0"
     }
 
+def write_all(output_path, data):
+    """Write bytes through an unbuffered file, retrying short writes"""
+    with open(output_path, 'wb', buffering=0) as f:
+        view = memoryview(data)
+        while view:
+            view = view[f.write(view):]
+
 def save_signature_data(signature_data, output_path):
     """Save signature data to file"""
-    with open(output_path, 'w') as f:
-        json.dump(signature_data, f, indent=2)
+    # orjson serializes large batch manifests several times faster than json
+    if orjson is not None:
+        write_all(output_path, orjson.dumps(signature_data, option=orjson.OPT_INDENT_2))
+    else:
+        with open(output_path, 'w') as f:
+            json.dump(signature_data, f, indent=2)
     
     print(f"✅ Signature data saved to: {output_path}")
 
-def save_signature_only(hmac_signature, output_path):
+def save_signature_only(hmac_signature, output_path, verbose=True):
     """Save only the HMAC signature to file"""
-    with open(output_path, 'w') as f:
-        f.write(hmac_signature)
+    # Hex signatures are pure ASCII; an unbuffered binary write skips the text layer
+    write_all(output_path, hmac_signature.encode('ascii'))
     
-    print(f"✅ HMAC signature saved to: {output_path}")
+    if verbose:
+        print(f"✅ HMAC signature saved to: {output_path}")
 
-def main():
-    if len(sys.argv) < 2:
-        print("❌ Error: APK file path is required")
-        print("Usage: python3 generate_apk_hmac.py <apk_file_path> [output_file_path]")
-        sys.exit(1)
-    
-    apk_path = sys.argv[1]
+def print_hash_backend():
+    """Report which hashlib backend will hash the APKs"""
+    if OPENSSL_VERSION:
+        print(f"⚙️  Hash backend: {OPENSSL_VERSION}")
+    else:
+        print("⚠️  hashlib is not backed by OpenSSL; SHA-256 will run without hardware acceleration")
+        print("   Build CPython --with-openssl for SHA-NI / ARMv8 crypto support")
+
+def select_hash_algorithm(fast):
+    """Pick the APK content hash algorithm"""
+    if fast:
+        if blake3 is not None:
+            return "BLAKE3"
+        print("⚠️  BLAKE3 requested but blake3 is not installed (pip install blake3); using SHA-256")
+    return "SHA-256"
+
+def resolve_fast(parser, fast_flag, records_algorithm, requirement):
+    """Decide whether BLAKE3 may be used for this output"""
+    # Plain signature files do not say which hash they cover, and the device
+    # recomputes SHA-256, so they must never be built from a BLAKE3 digest
+    if fast_flag:
+        if not records_algorithm:
+            parser.error(f"--fast (BLAKE3) requires {requirement} so hash_algorithm is recorded; "
+                         "plain signature files must use SHA-256 to verify on the device")
+        return True
+    if os.environ.get("APK_HMAC_FAST") == "1":
+        if not records_algorithm:
+            print("⚠️  APK_HMAC_FAST=1 ignored: plain signature files must use SHA-256 to verify on the device")
+            return False
+        return True
+    return False
+
+def sign_single_apk(args, hash_algorithm):
+    """Sign one APK and write its signature"""
+    apk_path = args.apk_path
+    # Build the path once and stat it once; both are reused below
+    apk_file = Path(apk_path).absolute()
     
     # Check if APK file exists
-    if not os.path.exists(apk_path):
+    try:
+        apk_stat = apk_file.stat()
+    except OSError:
         print(f"❌ Error: APK file not found: {apk_path}")
         sys.exit(1)
     
     # Generate output path if not provided
-    if len(sys.argv) >= 3:
-        output_path = sys.argv[2]
+    if args.output_path:
+        output_path = args.output_path
     else:
-        apk_name = Path(apk_path).stem
-        output_path = f"{apk_name}_hmac_signature.txt"
+        output_path = f"{apk_file.stem}_hmac_signature.txt"
     
     print(f"🔐 Generating HMAC signature for APK: {apk_path}")
     print(f"📁 Output file: {output_path}")
+    print_hash_backend()
     
     try:
         # Generate secure key
@@ -123,31 +309,32 @@ def main():
         
         # Calculate APK hash
         print("📊 Calculating APK hash...")
-        apk_hash = calculate_apk_hash(apk_path)
-        print(f"   APK hash: {apk_hash[:16]}...")
+        apk_hash = hash_apk(apk_path, hash_algorithm)
+        print(f"   APK hash ({hash_algorithm}): {apk_hash[:16]}...")
         
         # Generate HMAC signature
         print("🔏 Generating HMAC signature...")
-        hmac_signature, apk_hash = generate_hmac_signature(apk_path, key)
+        hmac_signature, apk_hash = generate_hmac_signature(apk_path, key, apk_hash)
         print(f"   HMAC signature: {hmac_signature[:16]}...")
         
-        # Create signature data
-        signature_data = create_signature_data(apk_path, hmac_signature, apk_hash)
-        
-        # Save signature data
+        # Save signature data; the full record is only built for JSON output
+        key_type = "software"
+        timestamp = int(time.time())
         if output_path.endswith('.json'):
+            signature_data = create_signature_data(apk_file, hmac_signature, apk_hash, key_type,
+                                                   hash_algorithm=hash_algorithm, timestamp=timestamp)
             save_signature_data(signature_data, output_path)
         else:
             save_signature_only(hmac_signature, output_path)
         
         # Print summary
         print("\n📋 SUMMARY:")
-        print(f"   APK File: {Path(apk_path).name}")
-        print(f"   APK Size: {os.path.getsize(apk_path) / (1024*1024):.2f} MB")
-        print(f"   APK Hash: {apk_hash}")
+        print(f"   APK File: {apk_file.name}")
+        print(f"   APK Size: {apk_stat.st_size / (1024*1024):.2f} MB")
+        print(f"   APK Hash ({hash_algorithm}): {apk_hash}")
         print(f"   HMAC Signature: {hmac_signature}")
-        print(f"   Key Type: {signature_data['key_type']}")
-        print(f"   Timestamp: {signature_data['timestamp']}")
+        print(f"   Key Type: {key_type}")
+        print(f"   Timestamp: {timestamp}")
         print(f"   Output File: {output_path}")
         
         print("\n✅ APK HMAC signature generated successfully!")
@@ -157,5 +344,84 @@ def main():
         print(f"❌ Error generating HMAC signature: {e}")
         sys.exit(1)
 
+def sign_batch(args, hash_algorithm):
+    """Sign several APKs with one shared key"""
+    apk_paths = args.batch
+    
+    missing = [p for p in apk_paths if not os.path.isfile(p)]
+    if missing:
+        print(f"❌ Error: APK file not found: {', '.join(missing)}")
+        sys.exit(1)
+    
+    print(f"🔐 Generating HMAC signatures for {len(apk_paths)} APKs")
+    if args.manifest:
+        print(f"📁 Manifest file: {args.manifest}")
+    print_hash_backend()
+    
+    try:
+        print("🔑 Generating secure HMAC key...")
+        key = generate_secure_key()
+        print(f"   Key generated: {key.hex()[:16]}...")
+        
+        print(f"📊 Hashing APKs ({hash_algorithm})...")
+        results = sign_apks_batch(apk_paths, key, hash_algorithm)
+        
+        if args.manifest:
+            records = [
+                create_signature_data(apk_path, hmac_signature, apk_hash, hash_algorithm=hash_algorithm)
+                for apk_path, (hmac_signature, apk_hash) in zip(apk_paths, results)
+            ]
+            save_signature_data(records, args.manifest)
+        else:
+            for apk_path, (hmac_signature, _) in zip(apk_paths, results):
+                save_signature_only(hmac_signature, f"{Path(apk_path).stem}_hmac_signature.txt", verbose=False)
+            print("✅ HMAC signatures saved to: <apk>_hmac_signature.txt")
+        
+        print("\n📋 SUMMARY:")
+        for apk_path, (hmac_signature, _) in zip(apk_paths, results):
+            print(f"   {Path(apk_path).name}: {hmac_signature}")
+        
+        print(f"\n✅ {len(apk_paths)} APK HMAC signatures generated successfully!")
+        
+    except Exception as e:
+        print(f"❌ Error generating HMAC signatures: {e}")
+        sys.exit(1)
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate HMAC-SHA256 signature for an APK file")
+    parser.add_argument("apk_path", nargs="?", default=None, help="Path to the APK file")
+    parser.add_argument("output_path", nargs="?", default=None,
+                        help="Output file; .json writes full signature data (default: <apk>_hmac_signature.txt)")
+    parser.add_argument("--fast", action="store_true",
+                        help="Hash with multi-threaded BLAKE3 (requires the blake3 package and a .json "
+                             "output or --manifest; also enabled by APK_HMAC_FAST=1)")
+    parser.add_argument("--batch", nargs="+", metavar="APK",
+                        help="Sign several APKs concurrently with one shared key")
+    parser.add_argument("--manifest", default=None,
+                        help="With --batch, write all signature data to this JSON file "
+                             "instead of one <apk>_hmac_signature.txt per APK")
+    args = parser.parse_args()
+    
+    if args.batch:
+        if args.apk_path or args.output_path:
+            parser.error("positional arguments cannot be combined with --batch")
+        if not args.manifest:
+            # Per-APK outputs are named by stem, so equal stems would overwrite each other
+            stems = [Path(p).stem for p in args.batch]
+            duplicates = sorted({stem for stem in stems if stems.count(stem) > 1})
+            if duplicates:
+                parser.error(f"APKs share a file name ({', '.join(duplicates)}); "
+                             "their signature files would collide, use --manifest instead")
+        fast = resolve_fast(parser, args.fast, bool(args.manifest), "--manifest")
+        sign_batch(args, select_hash_algorithm(fast))
+    elif args.manifest:
+        parser.error("--manifest requires --batch")
+    elif args.apk_path:
+        records_algorithm = (args.output_path or "").endswith('.json')
+        fast = resolve_fast(parser, args.fast, records_algorithm, "a .json output")
+        sign_single_apk(args, select_hash_algorithm(fast))
+    else:
+        parser.error("apk_path is required unless --batch is given")
+
 if __name__ == "__main__":
     main()
@@ -4,12 +4,17 @@ Generate secure HMAC signature for security_config.json using device-bound key s
 This script demonstrates how to create signatures that would work with the secure HMAC implementation.
 """
 
+import functools
 import hashlib
 import hmac
 import json
 import os
 import sys
 
+# Block size compute_hmac_sha256_file reads the config in
+CHUNK_SIZE = 1 << 20
+
+@functools.lru_cache(maxsize=128)
 def generate_device_bound_key_simulation(device_id: str, package_name: str) -> bytes:
     """
     Simulate device-bound key generation (this is just for demonstration).
@@ -18,9 +23,19 @@ def generate_device_bound_key_simulation(device_id: str, package_name: str) -> b
     binding_data = f"{device_id}:{package_name}:SecurityModule:HMAC"
     return hashlib.sha256(binding_data.encode()).digest()
 
-def compute_hmac_sha256(data: bytes, key: bytes) -> str:
-    """Compute HMAC-SHA256 and return as hex string."""
-    return hmac.new(key, data, hashlib.sha256).hexdigest()
+def compute_hmac_sha256(data: bytes, key: bytes) -> bytes:
+    """Compute HMAC-SHA256 and return the raw digest."""
+    return hmac.digest(key, data, 'sha256')
+
+def compute_hmac_sha256_file(path: str, key: bytes) -> tuple:
+    """Stream a file into HMAC-SHA256 and return (raw digest, bytes read)."""
+    h = hmac.new(key, None, hashlib.sha256)
+    size = 0
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            h.update(chunk)
+            size += len(chunk)
+    return h.digest(), size
 
 def main():
     # Configuration
@@ -32,18 +47,14 @@ def main():
     package_name = "com.miaadrajabi.securitysample"
     
     try:
-        # Read configuration file
-        with open(config_path, 'rb') as f:
-            config_data = f.read()
-        
-        print(f"📄 Read configuration file: {len(config_data)} bytes")
-        
         # Generate device-bound key (simulation)
         device_key = generate_device_bound_key_simulation(device_id, package_name)
         print(f"🔑 Generated device-bound key: {device_key.hex()[:16]}...")
         
-        # Compute HMAC signature
-        signature = compute_hmac_sha256(config_data, device_key)
+        # Compute HMAC signature while streaming the configuration file
+        signature_bytes, config_size = compute_hmac_sha256_file(config_path, device_key)
+        signature = signature_bytes.hex()
+        print(f"📄 Read configuration file: {config_size} bytes")
         print(f"✍️  Generated HMAC signature: {signature[:32]}...")
         
         # Write signature file
@@ -52,21 +63,16 @@ def main():
         
         print(f"💾 Signature saved to: {signature_path}")
         
-        # Verify signature
-        expected_signature = compute_hmac_sha256(config_data, device_key)
-        if signature == expected_signature:
-            print("✅ Signature verification successful")
-        else:
-            print("❌ Signature verification failed")
-            sys.exit(1)
-        
-        # Test with tampered data
-        tampered_data = config_data.replace(b'"rootDetection": true', b'"rootDetection": false')
-        tampered_signature = compute_hmac_sha256(tampered_data, device_key)
-        if tampered_signature != signature:
-            print("✅ Tamper detection working correctly")
+        # Self-test: check the key and HMAC distinguish a sentinel from its
+        # tampered variant; this does not re-verify the config signature
+        sentinel = b'{"rootDetection": true}'
+        tampered_sentinel = b'{"rootDetection": false}'
+        sentinel_signature_bytes = compute_hmac_sha256(sentinel, device_key)
+        tampered_signature_bytes = compute_hmac_sha256(tampered_sentinel, device_key)
+        if not hmac.compare_digest(sentinel_signature_bytes, tampered_signature_bytes):
+            print("✅ HMAC self-test passed (tampered sentinel changes the signature)")
         else:
-            print("❌ Tamper detection failed")
+            print("❌ HMAC self-test failed")
             sys.exit(1)
         
         print("\n🎉 Secure HMAC signature generation completed successfully!")
@@ -19,9 +19,28 @@ import hmac
 import os
 import sys
 
+# Upper bound on the stripped --key-file key; real HMAC keys are far smaller
+MAX_KEY_SIZE = 4096
+# Upper bound on the raw --key-file size, leaving room for surrounding whitespace
+MAX_KEY_FILE_SIZE = 64 * 1024
+# --config is fed to hmac_sha256_file_hex in blocks of this size
+CHUNK_SIZE = 1 << 20
 
-def hmac_sha256_hex(data: bytes, key: bytes) -> str:
-    return hmac.new(key, data, hashlib.sha256).hexdigest()
+
+def hashlib_has_openssl() -> bool:
+    try:
+        import _hashlib  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def hmac_sha256_file_hex(path: str, key: bytes) -> str:
+    h = hmac.new(key, None, hashlib.sha256)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
 
 
 def main():
@@ -34,6 +53,11 @@ def main():
     parser.add_argument("--out", default=None, help="Path to write signature (hex). If omitted, prints to stdout")
     args = parser.parse_args()
 
+    # Warn only; the builtin SHA-256 fallback is correct, just slow
+    if not hashlib_has_openssl():
+        print("Warning: hashlib is not backed by OpenSSL; HMAC-SHA256 runs without hardware acceleration. "
+              "Build CPython --with-openssl for SHA-NI / ARMv8 crypto support.", file=sys.stderr)
+
     # Load key
     if args.key is not None:
         key = args.key.encode("utf-8")
@@ -45,13 +69,17 @@ def main():
         key = val.encode("utf-8")
     else:
         with open(args.key_file, "rb") as f:
-            key = f.read().strip()
-
-    # Load config RAW
-    with open(args.config, "rb") as f:
-        raw = f.read()
+            raw = f.read(MAX_KEY_FILE_SIZE + 1)
+        if len(raw) > MAX_KEY_FILE_SIZE:
+            print(f"Key file {args.key_file} exceeds {MAX_KEY_FILE_SIZE} bytes", file=sys.stderr)
+            sys.exit(2)
+        key = raw.strip()
+        if len(key) > MAX_KEY_SIZE:
+            print(f"Key in {args.key_file} exceeds {MAX_KEY_SIZE} bytes", file=sys.stderr)
+            sys.exit(2)
 
-    sig = hmac_sha256_hex(raw, key)
+    # Stream config RAW bytes into the HMAC
+    sig = hmac_sha256_file_hex(args.config, key)
 
     if args.out:
         with open(args.out, "w", encoding="utf-8") as f: